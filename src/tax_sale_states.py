@@ -15,22 +15,45 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from contextlib import closing
-from zipfile import ZipFile, ZIP_DEFLATED
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from io import BytesIO, StringIO
+from xml.sax.saxutils import escape
 import abc
+import argparse
+import bisect
+import codecs
+import collections
+import collections.abc
 import csv
+import gzip
+import hashlib
 import json
 import os
+import random
+import re
+import shutil
 import time
 import datetime
 import itertools
+import sys
+import tempfile
+import threading
+import tracemalloc
+import warnings
 
 from bs4 import BeautifulSoup
-from py_markdown_table.markdown_table import markdown_table
+from bs4.builder import builder_registry
+import soupsieve
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.compat import safe_string
 from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
 from openpyxl.styles.numbers import FORMAT_TEXT
 from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
 from openpyxl.worksheet.filters import AutoFilter
@@ -39,7 +62,36 @@ from openpyxl.writer import theme, excel
 import requests
 from urllib3.exceptions import InsecureRequestWarning
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+try:
+    import orjson
+except ImportError:
+    # Optional; speeds up the compact and NDJSON formats.
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    # Optional; compresses the snapshots better than gzip.
+    zstandard = None
+
+try:
+    from py_markdown_table.markdown_table import markdown_table
+except ImportError:
+    # Only used to benchmark MarkdownTable.
+    markdown_table = None
+
+# Bump when the output files change for the same data, so that unchanged data is rebuilt once.
+BUILD_VERSION = "1"
+
 requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+# The table columns of the write-only worksheets are set explicitly.
+warnings.filterwarnings("ignore", "In write-only mode you must add table columns manually", UserWarning, "openpyxl")
 
 session = requests.Session()
 session.verify = False
@@ -54,14 +106,501 @@ def fetch_text_file(path: str) -> str:
         return text
 
 
+def fetch_json_file(path: str) -> any:
+    with open(path, encoding="utf8") as file:
+        return json.load(file)
+
+
 def write_text_file(path: str, data: any) -> None:
     with open(path, "w", encoding="utf-8") as file:
         file.write(data)
 
 
+def to_json_value(value: any) -> any:
+    # Serializes the records, row views and columnar data as the dicts and lists that they stand for.
+    if isinstance(value, StateRecord):
+        return value.to_dict()
+    if isinstance(value, collections.abc.Mapping):
+        return dict(value)
+    if isinstance(value, collections.abc.Sequence):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
 def write_json_file(path: str, data: any) -> None:
     with open(path, "w", encoding="utf8") as file:
-        json.dump(data, file, indent=4)
+        json.dump(data, file, indent=4, default=to_json_value)
+
+
+JSON_FORMATS = ["indent", "compact", "ndjson"]
+
+
+def write_json_records(path: str, records, format: str = "indent") -> None:
+    # compact and ndjson write UTF-8 rather than escapes, so that the output is the same with or without orjson.
+    if format not in JSON_FORMATS:
+        raise ValueError(f"Unknown JSON format: {format}")
+
+    if format == "indent":
+        write_json_file(path, records)
+        return
+
+    if orjson is not None:
+        with open(path, "wb") as file:
+            if format == "compact":
+                file.write(orjson.dumps(records, default=to_json_value))
+            else:
+                for record in records:
+                    file.write(orjson.dumps(record, default=to_json_value))
+                    file.write(b"\n")
+        return
+
+    with open(path, "w", encoding="utf8", newline="") as file:
+        if format == "compact":
+            json.dump(records, file, ensure_ascii=False, separators=(",", ":"), default=to_json_value)
+        else:
+            # One record per line, written as it is encoded.
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=to_json_value))
+                file.write("\n")
+
+
+def fetch_json_records(path: str) -> list:
+    # Reads the records in any of the formats written by write_json_records.
+    text = fetch_text_file(path)
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    # Only "\n" separates the records; splitlines would also split on characters that JSON leaves unescaped, such as U+2028.
+    return [json.loads(line) for line in text.split("\n") if line.strip()]
+
+
+def file_size(path: str) -> int:
+    return os.path.getsize(path)
+
+
+def get_peak_rss() -> int:
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return (peak_rss if sys.platform == "darwin" else peak_rss * 1024)
+
+
+def hash_json(data: any) -> str:
+    def default(value):
+        if isinstance(value, (collections.abc.Mapping, collections.abc.Sequence)):
+            return to_json_value(value)
+        return str(value)
+
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=default)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(65536), b""):
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+# BeautifulSoup tree builders, fastest first.
+PARSERS = ["lxml", "html.parser", "html5lib"]
+DEFAULT_PARSERS = ["lxml", "html.parser"]
+
+
+def available_parsers() -> list:
+    return [parser for parser in PARSERS if builder_registry.lookup(parser) is not None]
+
+
+def default_parser() -> str:
+    return next(parser for parser in DEFAULT_PARSERS if builder_registry.lookup(parser) is not None)
+
+
+class RetryPolicy():
+    RETRY_STATUS_CODES = frozenset([
+        requests.codes.request_timeout,
+        requests.codes.too_early,
+        requests.codes.too_many_requests,
+        requests.codes.internal_server_error,
+        requests.codes.bad_gateway,
+        requests.codes.service_unavailable,
+        requests.codes.gateway_timeout
+    ])
+
+    # Raised by the request, or while its body is read.
+    RETRY_EXCEPTIONS = (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        requests.exceptions.ContentDecodingError
+    )
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        initial_delay: float = 1.0,
+        max_delay: float = 60.0,
+        multiplier: float = 2.0,
+        jitter: float = 0.5,
+        timeout: float = 10.0,
+        deadline: float = 300.0
+    ) -> None:
+        super().__init__()
+
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        # Fraction of the delay that is randomized.
+        self.jitter = jitter
+        # Per-attempt timeout and total deadline, in seconds.
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def is_retryable(self, status_code: int) -> bool:
+        return status_code in self.RETRY_STATUS_CODES
+
+    def backoff_delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.initial_delay * (self.multiplier ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    @staticmethod
+    def retry_after_delay(response) -> float:
+        if response is None:
+            return None
+
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+    def delay(self, attempt: int, response=None) -> float:
+        delay = self.backoff_delay(attempt)
+        retry_after = self.retry_after_delay(response)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryAttempts():
+    # Attempts made to fetch a webpage, counted against the policy whether the request or the read of its body failed.
+    def __init__(self, retry_policy: RetryPolicy) -> None:
+        super().__init__()
+
+        self.retry_policy = retry_policy
+        self.count = 0
+        self.deadline = time.monotonic() + retry_policy.deadline
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def allows_retry(self, delay: float) -> bool:
+        return self.count < self.retry_policy.max_attempts and time.monotonic() + delay < self.deadline
+
+
+class BuildStats():
+    def __init__(self, name: str) -> None:
+        super().__init__()
+
+        self.name = name
+        self.stages = []
+
+    @contextmanager
+    def measure(self, stage: str):
+        # Sub-stages are named "<stage>.<sub-stage>" and are not counted in the totals.
+        # The peak RSS is process-wide, so the delta is only exact when building sequentially.
+        record = {
+            "stage": stage,
+            "wall_time": None,
+            "cpu_time": None,
+            "bytes_in": None,
+            "bytes_out": None,
+            "peak_rss_delta": None
+        }
+        self.stages.append(record)
+
+        peak_rss = get_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - wall_start
+            record["cpu_time"] = time.thread_time() - cpu_start
+            if peak_rss is not None:
+                record["peak_rss_delta"] = get_peak_rss() - peak_rss
+
+    def add_sub_stage_cpu_time(self, record: dict) -> None:
+        # For a stage whose sub-stages ran in other threads, which its own thread time does not include.
+        prefix = f"{record['stage']}."
+        record["cpu_time"] += sum(
+            stage["cpu_time"]
+            for stage in self.stages
+            if stage["stage"].startswith(prefix) and "." not in stage["stage"][len(prefix):] and stage["cpu_time"] is not None
+        )
+
+    def to_dict(self) -> dict:
+        stages = self.stages
+        top_stages = [stage for stage in stages if "." not in stage["stage"] and stage["wall_time"] is not None]
+        return {
+            "name": self.name,
+            "wall_time": sum(stage["wall_time"] for stage in top_stages),
+            "cpu_time": sum(stage["cpu_time"] for stage in top_stages),
+            "stages": stages
+        }
+
+
+class CompressionPolicy():
+    MODES = ["deflate", "stored", "mixed"]
+    # In the mixed mode, members smaller than this are stored; deflating them saves little and costs a compressor each.
+    SMALL_MEMBER_SIZE = 16 * 1024
+
+    def __init__(self, mode: str = "deflate", level: int = None, small_member_size: int = None, member_modes: dict = None) -> None:
+        super().__init__()
+
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown compression mode: {mode}")
+        if level is not None and not 1 <= level <= 9:
+            raise ValueError(f"Compression level must be between 1 and 9: {level}")
+
+        self.mode = mode
+        # None uses zlib's default level.
+        self.level = level
+        self.small_member_size = (small_member_size if small_member_size is not None else self.SMALL_MEMBER_SIZE)
+        # Mode of specific members, by name.
+        self.member_modes = (member_modes if member_modes is not None else {})
+
+    def get(self, name: str, size: int = None) -> tuple:
+        # Members of unknown size (streamed) are treated as large.
+        mode = self.member_modes.get(name, self.mode)
+        if mode == "mixed":
+            mode = ("stored" if size is not None and size < self.small_member_size else "deflate")
+
+        if mode == "stored":
+            return ZIP_STORED, None
+        return ZIP_DEFLATED, self.level
+
+    def apply(self, zip_info: ZipInfo, size: int = None) -> ZipInfo:
+        compress_type, compresslevel = self.get(zip_info.filename, size)
+        zip_info.compress_type = compress_type
+        # ZipFile.open reads the level from here when streaming a member.
+        zip_info._compresslevel = compresslevel
+        return zip_info
+
+
+class OrderedZipFile(ZipFile):
+    # Holds the members back until closed, then writes the first names before the others, compressing each member once.
+    def __init__(self, file, first_names: list, *args, compression_policy: CompressionPolicy = None, **kwargs) -> None:
+        self.first_names = first_names
+        self.compression_policy = compression_policy
+        self.pending = {}
+        super().__init__(file, *args, **kwargs)
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None) -> None:
+        name = (zinfo_or_arcname.filename if isinstance(zinfo_or_arcname, ZipInfo) else zinfo_or_arcname)
+        self.pending[name] = (zinfo_or_arcname, data, compress_type, compresslevel)
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None) -> None:
+        # Spooled to a temporary file rather than read into memory, since openpyxl removes the file once written.
+        zip_info = ZipInfo.from_file(filename, arcname, strict_timestamps=self._strict_timestamps)
+        spool = tempfile.TemporaryFile()
+        with open(filename, "rb") as file:
+            shutil.copyfileobj(file, spool)
+        self.pending[zip_info.filename] = (zip_info, spool, compress_type, compresslevel)
+
+    def write_spool(self, zip_info: ZipInfo, spool, compress_type=None, compresslevel=None) -> None:
+        with spool:
+            size = spool.seek(0, os.SEEK_END)
+            spool.seek(0)
+
+            if self.compression_policy is not None and compress_type is None:
+                compress_type, compresslevel = self.compression_policy.get(zip_info.filename, size)
+            zip_info.compress_type = (compress_type if compress_type is not None else self.compression)
+            zip_info._compresslevel = (compresslevel if compresslevel is not None else self.compresslevel)
+            zip_info.file_size = size
+
+            with self.open(zip_info, "w") as member:
+                shutil.copyfileobj(spool, member)
+
+    def close(self) -> None:
+        pending = self.pending
+        if self.fp is not None and pending:
+            first_names = [name for name in self.first_names if name in pending]
+            remaining_names = [name for name in pending if name not in first_names]
+            compression_policy = self.compression_policy
+            for name in first_names + remaining_names:
+                zinfo_or_arcname, data, compress_type, compresslevel = pending[name]
+                if not isinstance(data, (str, bytes)):
+                    self.write_spool(zinfo_or_arcname, data, compress_type, compresslevel)
+                    continue
+                if compression_policy is not None and compress_type is None:
+                    if isinstance(data, str):
+                        data = data.encode("utf-8")
+                    compress_type, compresslevel = compression_policy.get(name, len(data))
+                super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+            pending.clear()
+
+        super().close()
+
+
+class ColumnWidths():
+    # Excel's maximum column width.
+    MAX_WIDTH = 255
+
+    def __init__(self, column_count: int, max_width: int = None, sample_size: int = None) -> None:
+        super().__init__()
+
+        self.widths = [0] * column_count
+        self.max_width = max_width
+        # Number of rows to measure; None measures every row.
+        self.sample_size = sample_size
+        self.row_count = 0
+
+    def add(self, values, sampled: bool = True) -> None:
+        if sampled:
+            if self.sample_size is not None and self.row_count >= self.sample_size:
+                return
+            self.row_count += 1
+
+        widths = self.widths
+        for c, value in enumerate(values):
+            length = (len(value) if isinstance(value, str) else len(str(value)) if value is not None else 0)
+            if length > widths[c]:
+                widths[c] = length
+
+    def get_widths(self) -> list:
+        max_width = self.max_width
+        if max_width is None:
+            return list(self.widths)
+        return [min(width, max_width) for width in self.widths]
+
+
+class SharedStrings():
+    # Columns with at most this ratio of distinct values to rows are stored in the shared strings table.
+    MAX_UNIQUE_RATIO = 0.5
+
+    CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+    RELATIONSHIP_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+
+    def __init__(self, max_unique_ratio: float = None) -> None:
+        super().__init__()
+
+        self.max_unique_ratio = (max_unique_ratio if max_unique_ratio is not None else self.MAX_UNIQUE_RATIO)
+        self.indexes = {}
+        # Number of cells referencing the table.
+        self.count = 0
+
+    def is_categorical(self, unique_count: int, row_count: int) -> bool:
+        return row_count > 0 and unique_count <= row_count * self.max_unique_ratio
+
+    def index(self, value: str) -> int:
+        self.count += 1
+        indexes = self.indexes
+        i = indexes.get(value)
+        if i is None:
+            i = indexes[value] = len(indexes)
+        return i
+
+    @property
+    def unique_count(self) -> int:
+        return len(self.indexes)
+
+    def dedup_ratio(self) -> float:
+        # Cells per stored string.
+        return (self.count / self.unique_count if self.indexes else None)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "unique_count": self.unique_count,
+            "dedup_ratio": self.dedup_ratio()
+        }
+
+    def to_xml(self) -> str:
+        items = []
+        for value in self.indexes:
+            space = (" xml:space=\"preserve\"" if value != value.strip() else "")
+            items.append(f"<si><t{space}>{escape_xml_text(value)}</t></si>")
+        return (
+            f"<sst xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\" count=\"{self.count}\" uniqueCount=\"{self.unique_count}\">"
+            f"{''.join(items)}</sst>"
+        )
+
+
+class WorkbookTemplate():
+    THEME_COLOR = {
+        "1F497D": "44546A",
+        "EEECE1": "E7E6E6",
+        "4F81BD": "5B9BD5",
+        "C0504D": "ED7D31",
+        "9BBB59": "A5A5A5",
+        "8064A2": "FFC000",
+        "4BACC6": "4472C4",
+        "F79646": "70AD47",
+        "0000FF": "0563C1",
+        "800080": "954F72"
+    }
+
+    instance = None
+    instance_lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        # Computed once per process and shared by every workbook.
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = cls()
+            return cls.instance
+
+    @classmethod
+    def patch_theme_xml(cls, xml: str) -> str:
+        for original, replacement in cls.THEME_COLOR.items():
+            xml = xml.replace(f"val=\"{original}\"", f"val=\"{replacement}\"")
+        return xml
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.theme_xml = self.patch_theme_xml(theme.theme_xml)
+
+        self.table_style = TableStyleInfo(
+            name="TableStyleMedium2",
+            showFirstColumn=False,
+            showLastColumn=False,
+            showRowStripes=True,
+            showColumnStripes=False
+        )
+
+        self.table_columns = {}
+
+    def get_table_columns(self, titles: list) -> tuple:
+        key = tuple(titles)
+        table_columns = self.table_columns.get(key)
+        if table_columns is None:
+            table_columns = tuple(TableColumn(id=h, name=header) for h, header in enumerate(titles, start=1))
+            total_column = table_columns[0]
+            total_column.totalsRowLabel = "Total"
+            count_column = table_columns[-1]
+            count_column.totalsRowFunction = "count"
+            self.table_columns[key] = table_columns
+        return table_columns
+
+    def create_workbook(self, write_only: bool = False):
+        workbook = Workbook(write_only=write_only)
+        workbook.loaded_theme = self.theme_xml
+        return workbook
 
 
 class WorkbookController():
@@ -79,68 +618,62 @@ class WorkbookController():
 
     ISO_8601_NUMBER_FORMAT = "yyyy-mm-ddThh:MM:ss"
 
-    was_theme_updated = False
+    @classmethod
+    def save_workbook(cls, workbook, compression_policy: CompressionPolicy = None) -> BytesIO:
+        # Same as openpyxl's save_workbook, but with the content types, workbook and styles first.
+        buffer = BytesIO()
 
-    def __init__(self) -> None:
-        cls = self.__class__
-        if not cls.was_theme_updated:
-            self.update_theme()
-            cls.was_theme_updated = True
+        with OrderedZipFile(buffer, cls.FIRST_NAMES, "w", ZIP_DEFLATED, allowZip64=True, compression_policy=compression_policy) as zip_file:
+            workbook.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+            writer = excel.ExcelWriter(workbook, zip_file)
+            writer.save()
 
-    @staticmethod
-    def update_theme() -> None:
-        color = {
-            "1F497D": "44546A",
-            "EEECE1": "E7E6E6",
-            "4F81BD": "5B9BD5",
-            "C0504D": "ED7D31",
-            "9BBB59": "A5A5A5",
-            "8064A2": "FFC000",
-            "4BACC6": "4472C4",
-            "F79646": "70AD47",
-            "0000FF": "0563C1",
-            "800080": "954F72"
-        }
+        return buffer
 
-        xml = theme.theme_xml
-        for original, replacement in color.items():
-            xml = xml.replace(f"val=\"{original}\"", f"val=\"{replacement}\"")
+    @classmethod
+    def cell_format(cls, value) -> tuple:
+        if isinstance(value, datetime.datetime):
+            return cls.ISO_8601_NUMBER_FORMAT, "d"
+        return FORMAT_TEXT, "s"
 
-        theme.theme_xml = xml
-        excel.theme_xml = xml
+    @staticmethod
+    def set_column_widths(worksheet, widths: list):
+        for c, width in enumerate(widths, start=1):
+            worksheet.column_dimensions[get_column_letter(c)].width = width
 
-    @classmethod
-    def fix_workbook_mime_type(cls, file_path):
-        buffer = BytesIO()
+        return worksheet
 
-        with ZipFile(file_path) as zip_file:
-            names = zip_file.namelist()
+    @classmethod
+    def write_rows(cls, sheet, keys, rows, column_widths: ColumnWidths = None) -> None:
+        for r, row in enumerate(rows, start=1):
+            values = [(row[key] if key in row else "") for key in keys]
+            for c, value in enumerate(values, start=1):
+                cell = sheet.cell(row=r, column=c)
 
-            FIRST_NAMES = cls.FIRST_NAMES
-            remaining_names = [name for name in names if name not in FIRST_NAMES]
-            ordered_names = FIRST_NAMES + remaining_names
+                cell_number_format, cell_data_type = cls.cell_format(value)
 
-            with ZipFile(buffer, "w", ZIP_DEFLATED, allowZip64=True) as buffer_zip_file:
-                for name in ordered_names:
-                    try:
-                        file = zip_file.open(name)
-                        buffer_zip_file.writestr(file.name, file.read())
-                    except KeyError:
-                        pass
+                cell.number_format = cell_number_format
+                cell.value = value
+                cell.data_type = cell_data_type
 
-        return buffer
+            if column_widths is not None:
+                column_widths.add(values)
 
-    @staticmethod
-    def autosize_columns(worksheet):
-        def value_of(value):
-            return (str(value) if value is not None else "")
+    @classmethod
+    def append_rows(cls, sheet, keys, rows) -> None:
+        # Write-only: each row is serialized as soon as it is appended.
+        for row in rows:
+            cells = []
+            for key in keys:
+                value = (row[key] if key in row else "")
+                cell = WriteOnlyCell(sheet, value)
 
-        for cells in worksheet.columns:
-            length = max(len(value_of(cell.value)) for cell in cells)
-            column_letter = get_column_letter(cells[0].column)
-            worksheet.column_dimensions[column_letter].width = length
+                cell_number_format, cell_data_type = cls.cell_format(value)
 
-        return worksheet
+                cell.number_format = cell_number_format
+                cell.data_type = cell_data_type
+                cells.append(cell)
+            sheet.append(cells)
 
     @classmethod
     def create_workbook(
@@ -151,86 +684,788 @@ class WorkbookController():
 
         workbook_title: str = "Workbook",
         sheet_title: str = "Sheet",
-        table_name: str = "Table"
+        table_name: str = "Table",
+
+        write_only: bool = False,
+        max_column_width: int = None,
+        column_width_sample_size: int = None
     ):
         keys = key_title.keys()
         titles = list(key_title.values())
 
         # Initialize workbook and worksheet.
-        workbook = Workbook()
+        template = WorkbookTemplate.get()
+        workbook = template.create_workbook(write_only)
         properties = workbook.properties
         properties.title = workbook_title
         properties.creator = None
 
-        sheet = workbook.active
-        sheet.title = sheet_title
+        if write_only:
+            sheet = workbook.create_sheet(sheet_title)
+        else:
+            sheet = workbook.active
+            sheet.title = sheet_title
 
-        # Add data.
-        rows = [key_title] + data
-        for r, row in enumerate(rows, start=1):
-            for c, key in enumerate(keys, start=1):
-                value = (row[key] if key in row else "")
-                cell = sheet.cell(row=r, column=c)
-
-                cell_number_format = FORMAT_TEXT
-                cell_value = value
-                cell_data_type = "s"
-                if isinstance(value, datetime.datetime):
-                    cell_number_format = cls.ISO_8601_NUMBER_FORMAT
-                    cell_data_type = "d"
-
-                cell.number_format = cell_number_format
-                cell.value = cell_value
-                cell.data_type = cell_data_type
+        rows = [key_title, *data]
 
         total_row = [""] * len(keys)
         total_row[0] = "Total"
         total_row[-1] = f"=SUBTOTAL(103,{table_name}[{titles[-1]}])"
-        sheet.append(total_row)
 
-        # Add table.
-        style = TableStyleInfo(
-            name="TableStyleMedium2",
-            showFirstColumn=False,
-            showLastColumn=False,
-            showRowStripes=True,
-            showColumnStripes=False
-        )
+        max_column = len(keys)
+        max_column_letter = get_column_letter(max_column)
+        max_row = len(rows) + 1
+
+        # Set the active cell under the table.
+        active_cell = f"A{max_row + 1}"
+        selection = sheet.sheet_view.selection[0]
+        selection.activeCell = active_cell
+        selection.sqref = active_cell
 
-        table_columns = tuple(TableColumn(id=h, name=header) for h, header in enumerate(titles, start=1))
-        total_column = table_columns[0]
-        total_column.totalsRowLabel = "Total"
-        count_column = table_columns[-1]
-        count_column.totalsRowFunction = "count"
+        column_widths = ColumnWidths(len(keys), max_column_width, column_width_sample_size)
+        column_widths.add(total_row, sampled=False)
 
-        max_column = sheet.max_column
-        max_column_letter = get_column_letter(max_column)
-        max_row = sheet.max_row
+        # Add data.
+        if write_only:
+            # The dimension and column sizes are written before the rows, so only the values are measured first.
+            dimension = f"A1:{max_column_letter}{max_row}"
+            # openpyxl's WorksheetWriter.write_dimensions writes calculate_dimension() if the worksheet has one, which
+            # write-only worksheets lack (verified against openpyxl 3.1.5).
+            sheet.calculate_dimension = lambda: dimension
+            for row in rows:
+                if column_widths.sample_size is not None and column_widths.row_count >= column_widths.sample_size:
+                    break
+                column_widths.add([(row[key] if key in row else "") for key in keys])
+            cls.set_column_widths(sheet, column_widths.get_widths())
+
+            cls.append_rows(sheet, keys, rows)
+        else:
+            cls.write_rows(sheet, keys, rows, column_widths)
+
+        sheet.append(total_row)
+
+        # Add table.
         table = Table(
             displayName=table_name,
             ref=f"A1:{max_column_letter}{max_row}",
             autoFilter=AutoFilter(ref=f"A1:{max_column_letter}{max_row - 1}"),
-            tableStyleInfo=style,
+            tableStyleInfo=template.table_style,
             totalsRowShown=True,
             totalsRowCount=1,
-            tableColumns=table_columns
+            tableColumns=template.get_table_columns(titles)
         )
 
         sheet.add_table(table)
 
         # Adjust column sizes.
-        cls.autosize_columns(sheet)
+        if not write_only:
+            cls.set_column_widths(sheet, column_widths.get_widths())
 
-        # Set the active cell under the table.
+        return workbook
+
+
+def escape_xml_text(text: str) -> str:
+    return escape(text).replace("\r", "&#13;")
+
+
+def escape_xml_attribute(text: str) -> str:
+    return escape(text, {"\"": "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"})
+
+
+def encode_xml(xml: str) -> bytes:
+    # Same as openpyxl's serializer: ASCII with character references.
+    return xml.encode("ascii", "xmlcharrefreplace")
+
+
+class TemplateWorkbookWriter():
+    # Writes the same package as WorkbookController.create_workbook without building openpyxl cells.
+    SHEET_FILE_NAME = "xl/worksheets/sheet1.xml"
+    TABLE_FILE_NAME = "xl/tables/table1.xml"
+    WORKBOOK_FILE_NAME = "xl/workbook.xml"
+    CORE_FILE_NAME = "docProps/core.xml"
+    CONTENT_TYPES_FILE_NAME = "[Content_Types].xml"
+    WORKBOOK_RELS_FILE_NAME = "xl/_rels/workbook.xml.rels"
+    SHARED_STRINGS_FILE_NAME = "xl/sharedStrings.xml"
+
+    PLACEHOLDER = "\ue000"
+    PLACEHOLDER_DATETIME = datetime.datetime(2000, 1, 1)
+
+    TEXT_STYLE_ID = 1
+    DATE_STYLE_ID = 2
+
+    SHEET_HEAD = (
+        "<worksheet xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\">"
+        "<sheetPr><outlinePr summaryBelow=\"1\" summaryRight=\"1\"/><pageSetUpPr/></sheetPr>"
+        "<dimension ref=\"{dimension}\"/>"
+        "<sheetViews><sheetView workbookViewId=\"0\"><selection activeCell=\"{active_cell}\" sqref=\"{active_cell}\"/></sheetView></sheetViews>"
+        "<sheetFormatPr baseColWidth=\"8\" defaultRowHeight=\"15\"/>"
+        "<cols>{cols}</cols>"
+        "<sheetData>"
+    )
+    SHEET_TAIL = (
+        "</sheetData>"
+        "<pageMargins left=\"0.75\" right=\"0.75\" top=\"1\" bottom=\"1\" header=\"0.5\" footer=\"0.5\"/>"
+        "<tableParts count=\"1\"><tablePart xmlns:r=\"http://schemas.openxmlformats.org/officeDocument/2006/relationships\" r:id=\"rId1\"/></tableParts>"
+        "</worksheet>"
+    )
+    TABLE = (
+        "<table id=\"1\" name=\"{name}\" displayName=\"{name}\" ref=\"{ref}\" headerRowCount=\"1\" totalsRowCount=\"1\" totalsRowShown=\"1\""
+        " xmlns=\"http://schemas.openxmlformats.org/spreadsheetml/2006/main\">"
+        "<autoFilter ref=\"{filter_ref}\"/>"
+        "<tableColumns count=\"{count}\">{columns}</tableColumns>"
+        "<tableStyleInfo name=\"TableStyleMedium2\" showFirstColumn=\"0\" showLastColumn=\"0\" showRowStripes=\"1\" showColumnStripes=\"0\"/>"
+        "</table>"
+    )
+
+    skeletons = {}
+    skeleton_lock = threading.Lock()
+
+    @classmethod
+    def get_skeleton(cls, has_dates: bool) -> list:
+        # Rendered once by openpyxl with placeholders, then reused for every workbook.
+        with cls.skeleton_lock:
+            skeleton = cls.skeletons.get(has_dates)
+            if skeleton is None:
+                placeholder = cls.PLACEHOLDER
+                data = [{placeholder: (cls.PLACEHOLDER_DATETIME if has_dates else placeholder)}]
+                workbook = WorkbookController.create_workbook(
+                    key_title={placeholder: placeholder},
+                    data=data,
+
+                    workbook_title=placeholder,
+                    sheet_title=placeholder,
+                    table_name="Table"
+                )
+                properties = workbook.properties
+                properties.created = cls.PLACEHOLDER_DATETIME
+                with closing(workbook):
+                    buffer = WorkbookController.save_workbook(workbook)
+
+                with ZipFile(buffer) as zip_file:
+                    skeleton = [(name, zip_file.read(name)) for name in zip_file.namelist()]
+                cls.skeletons[has_dates] = skeleton
+            return skeleton
+
+    @classmethod
+    def render_cell(cls, reference: str, value, style_id: int = None) -> str:
+        style = (f" s=\"{style_id}\"" if style_id is not None else "")
+        if isinstance(value, datetime.datetime):
+            return f"<c r=\"{reference}\"{style} t=\"n\"><v>{safe_string(to_excel(value))}</v></c>"
+        if value is None or value == "":
+            return f"<c r=\"{reference}\"{style} t=\"inlineStr\"></c>"
+        if not isinstance(value, str):
+            value = str(value)
+        space = (" xml:space=\"preserve\"" if value != value.strip() else "")
+        return f"<c r=\"{reference}\"{style} t=\"inlineStr\"><is><t{space}>{escape_xml_text(value)}</t></is></c>"
+
+    @classmethod
+    def render_rows(cls, keys: list, rows: list, column_letters: list, shared_strings: SharedStrings = None, shared_columns: list = None):
+        text_style_id = cls.TEXT_STYLE_ID
+        date_style_id = cls.DATE_STYLE_ID
+        render_cell = cls.render_cell
+        if shared_columns is None:
+            shared_columns = [False] * len(keys)
+        columns = list(zip(column_letters, keys, shared_columns))
+        for r, row in enumerate(rows, start=1):
+            cells = []
+            # The header row is never shared.
+            for letter, key, is_shared in columns:
+                value = (row[key] if key in row else "")
+                if is_shared and r > 1 and value and isinstance(value, str):
+                    cells.append(f"<c r=\"{letter}{r}\" s=\"{text_style_id}\" t=\"s\"><v>{shared_strings.index(value)}</v></c>")
+                    continue
+                style_id = (date_style_id if isinstance(value, datetime.datetime) else text_style_id)
+                cells.append(render_cell(f"{letter}{r}", value, style_id))
+            yield f"<row r=\"{r}\">{''.join(cells)}</row>"
+
+    @staticmethod
+    def add_shared_strings_part(name: str, data: bytes) -> bytes:
+        if name == TemplateWorkbookWriter.CONTENT_TYPES_FILE_NAME:
+            override = f"<Override PartName=\"/{TemplateWorkbookWriter.SHARED_STRINGS_FILE_NAME}\" ContentType=\"{SharedStrings.CONTENT_TYPE}\"/>"
+            return data.replace(b"</Types>", override.encode("utf-8") + b"</Types>")
+        if name == TemplateWorkbookWriter.WORKBOOK_RELS_FILE_NAME:
+            relationship_id = f"rId{data.count(b'<Relationship ') + 1}"
+            relationship = f"<Relationship Type=\"{SharedStrings.RELATIONSHIP_TYPE}\" Target=\"sharedStrings.xml\" Id=\"{relationship_id}\"/>"
+            return data.replace(b"</Relationships>", relationship.encode("utf-8") + b"</Relationships>")
+        return data
+
+    @classmethod
+    def render_total_row(cls, total_row: list, column_letters: list, r: int) -> str:
+        cells = []
+        for letter, value in zip(column_letters, total_row):
+            reference = f"{letter}{r}"
+            if value.startswith("="):
+                cells.append(f"<c r=\"{reference}\"><f>{escape_xml_text(value[1:])}</f><v></v></c>")
+            else:
+                cells.append(cls.render_cell(reference, value))
+        return f"<row r=\"{r}\">{''.join(cells)}</row>"
+
+    @classmethod
+    def render_table(cls, table_name: str, titles: list, ref: str, filter_ref: str) -> str:
+        columns = []
+        last = len(titles)
+        for h, title in enumerate(titles, start=1):
+            attributes = ""
+            if h == 1:
+                attributes += " totalsRowLabel=\"Total\""
+            if h == last:
+                attributes += " totalsRowFunction=\"count\""
+            columns.append(f"<tableColumn id=\"{h}\" name=\"{escape_xml_attribute(title)}\"{attributes}/>")
+        return cls.TABLE.format(
+            name=escape_xml_attribute(table_name),
+            ref=ref,
+            filter_ref=filter_ref,
+            count=len(titles),
+            columns="".join(columns)
+        )
+
+    @classmethod
+    def create_workbook(
+        cls,
+
+        key_title: dict = {},
+        data: list = [],
+
+        workbook_title: str = "Workbook",
+        sheet_title: str = "Sheet",
+        table_name: str = "Table",
+
+        max_column_width: int = None,
+        column_width_sample_size: int = None,
+        shared_strings: SharedStrings = None,
+        compression_policy: CompressionPolicy = None
+    ) -> BytesIO:
+        if compression_policy is None:
+            compression_policy = CompressionPolicy()
+
+        keys = list(key_title.keys())
+        titles = list(key_title.values())
+
+        rows = [key_title, *data]
+
+        total_row = [""] * len(keys)
+        total_row[0] = "Total"
+        total_row[-1] = f"=SUBTOTAL(103,{table_name}[{titles[-1]}])"
+
+        max_column = len(keys)
+        max_column_letter = get_column_letter(max_column)
+        max_row = len(rows) + 1
+        column_letters = [get_column_letter(c) for c in range(1, max_column + 1)]
+
+        # The column sizes precede the rows, so the values are measured first.
+        column_widths = ColumnWidths(max_column, max_column_width, column_width_sample_size)
+        column_widths.add(total_row, sampled=False)
+        has_dates = False
+        column_values = [set() for _ in keys]
+        for r, row in enumerate(rows):
+            values = [(row[key] if key in row else "") for key in keys]
+            column_widths.add(values)
+            if not has_dates:
+                has_dates = any(isinstance(value, datetime.datetime) for value in values)
+            if shared_strings is not None and r > 0:
+                for c, value in enumerate(values):
+                    if isinstance(value, str):
+                        column_values[c].add(value)
+
+        shared_columns = None
+        if shared_strings is not None:
+            shared_columns = [shared_strings.is_categorical(len(values), len(data)) for values in column_values]
+
+        cols = "".join(
+            f"<col width=\"{width}\" customWidth=\"1\" min=\"{c}\" max=\"{c}\"/>"
+            for c, width in enumerate(column_widths.get_widths(), start=1)
+        )
         active_cell = f"A{max_row + 1}"
-        selection = sheet.sheet_view.selection[0]
-        selection.activeCell = active_cell
-        selection.sqref = active_cell
+        sheet_head = cls.SHEET_HEAD.format(dimension=f"A1:{max_column_letter}{max_row}", active_cell=active_cell, cols=cols)
 
-        return workbook
+        now = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+        # Unlike the worksheet, the other parts are written as UTF-8 rather than with character references.
+        placeholder_datetime = (cls.PLACEHOLDER_DATETIME.isoformat(timespec="seconds") + "Z").encode("utf-8")
+        now_datetime = (now.isoformat(timespec="seconds") + "Z").encode("utf-8")
+        placeholder = cls.PLACEHOLDER.encode("utf-8")
+
+        buffer = BytesIO()
+        with ZipFile(buffer, "w", ZIP_DEFLATED, allowZip64=True) as zip_file:
+            for name, skeleton_data in cls.get_skeleton(has_dates):
+                zip_info = ZipInfo(name, date_time=time.localtime(time.time())[:6])
+                zip_info.external_attr = 0o600 << 16
+
+                if name == cls.SHEET_FILE_NAME:
+                    # Stream the rows straight into the archive.
+                    compression_policy.apply(zip_info)
+                    with zip_file.open(zip_info, "w") as file:
+                        file.write(encode_xml(sheet_head))
+                        for row_xml in cls.render_rows(keys, rows, column_letters, shared_strings, shared_columns):
+                            file.write(encode_xml(row_xml))
+                        file.write(encode_xml(cls.render_total_row(total_row, column_letters, max_row)))
+                        file.write(encode_xml(cls.SHEET_TAIL))
+
+                    if shared_strings is not None:
+                        shared_strings_info = ZipInfo(cls.SHARED_STRINGS_FILE_NAME, date_time=zip_info.date_time)
+                        shared_strings_info.external_attr = 0o600 << 16
+                        shared_strings_data = encode_xml(shared_strings.to_xml())
+                        compression_policy.apply(shared_strings_info, len(shared_strings_data))
+                        zip_file.writestr(shared_strings_info, shared_strings_data)
+                    continue
+
+                if name == cls.TABLE_FILE_NAME:
+                    member_data = cls.render_table(
+                        table_name,
+                        titles,
+                        f"A1:{max_column_letter}{max_row}",
+                        f"A1:{max_column_letter}{max_row - 1}"
+                    ).encode("utf-8")
+                elif name == cls.WORKBOOK_FILE_NAME:
+                    member_data = skeleton_data.replace(placeholder, escape_xml_attribute(sheet_title).encode("utf-8"))
+                elif name == cls.CORE_FILE_NAME:
+                    member_data = (
+                        skeleton_data
+                        .replace(placeholder, escape_xml_text(workbook_title).encode("utf-8"))
+                        .replace(placeholder_datetime, now_datetime)
+                    )
+                elif shared_strings is not None:
+                    member_data = cls.add_shared_strings_part(name, skeleton_data)
+                else:
+                    member_data = skeleton_data
+
+                compression_policy.apply(zip_info, len(member_data))
+                zip_file.writestr(zip_info, member_data)
+
+        return buffer
+
+
+class MarkdownTable():
+    # grid: the same output as py_markdown_table's defaults; gfm: a compact pipe table; aligned: a padded pipe table.
+    FORMATS = ["grid", "gfm", "aligned"]
+
+    def __init__(self, data: list, format: str = "grid") -> None:
+        super().__init__()
+
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown markdown format: {format}")
+        if not data:
+            raise ValueError("Data contains no rows")
+
+        self.data = data
+        self.format = format
+
+    def get_markdown(self) -> str:
+        return getattr(self, f"get_{self.format}_markdown")()
+
+    @staticmethod
+    def escape_cell(value) -> str:
+        text = (value if isinstance(value, str) else str(value))
+        return text.replace("|", "\\|").replace("\r\n", "<br>").replace("\n", "<br>")
+
+    def get_cells(self, escape: bool) -> tuple:
+        # Converts every cell and measures the columns in a single pass.
+        keys = list(self.data[0].keys())
+        convert = (self.escape_cell if escape else str)
+        header = [convert(key) for key in keys]
+        widths = [len(text) for text in header]
+        rows = []
+        for item in self.data:
+            values = []
+            for c, key in enumerate(keys):
+                value = item[key]
+                text = (value if isinstance(value, str) and not escape else convert(value))
+                if len(text) > widths[c]:
+                    widths[c] = len(text)
+                values.append(text)
+            rows.append(values)
+        return header, rows, widths
+
+    def get_grid_markdown(self) -> str:
+        header, rows, widths = self.get_cells(escape=False)
+
+        def render(values):
+            cells = []
+            for text, width in zip(values, widths):
+                # Centered, with the odd space on the left.
+                margin = width - len(text)
+                right = margin // 2
+                cells.append(" " * (margin - right) + text + " " * right)
+            return "|" + "|".join(cells) + "|"
+
+        separator = "+" + "+".join("-" * width for width in widths) + "+"
+        lines = [separator, render(header), separator]
+        for values in rows:
+            lines.append(render(values))
+            lines.append(separator)
+        return "```\n" + "\n".join(lines) + "```"
+
+    def get_gfm_markdown(self) -> str:
+        escape_cell = self.escape_cell
+        keys = list(self.data[0].keys())
+        lines = [
+            "| " + " | ".join(escape_cell(key) for key in keys) + " |",
+            "|" + "|".join(" --- " for _ in keys) + "|"
+        ]
+        for item in self.data:
+            lines.append("| " + " | ".join(escape_cell(item[key]) for key in keys) + " |")
+        return "\n".join(lines) + "\n"
+
+    def get_aligned_markdown(self) -> str:
+        header, rows, widths = self.get_cells(escape=True)
+        # The delimiter row needs at least three dashes.
+        widths = [max(width, 3) for width in widths]
+
+        def render(values):
+            return "| " + " | ".join(text.ljust(width) for text, width in zip(values, widths)) + " |"
+
+        lines = [render(header), "| " + " | ".join("-" * width for width in widths) + " |"]
+        for values in rows:
+            lines.append(render(values))
+        return "\n".join(lines) + "\n"
+
+
+class StateExtractor(HTMLParser):
+    VOID_ELEMENTS = frozenset([
+        "area", "base", "br", "col", "embed", "hr", "img", "input",
+        "link", "meta", "param", "source", "track", "wbr"
+    ])
+    RAW_TEXT_ELEMENTS = frozenset(["script", "style", "template"])
+
+    class Element():
+        def __init__(self, tag: str, classes: frozenset, parent=None) -> None:
+            self.tag = tag
+            self.classes = classes
+            # Classes of the previous sibling element, for the "+" combinator.
+            self.last_child_classes = frozenset()
+
+            is_parent_inner = (parent is not None and "e-con-inner" in parent.classes)
+            is_parent_child = (parent is not None and parent.is_child)
+            # ".e-con-inner > .e-child" and ".e-con-inner > .e-child > .e-child".
+            self.is_child = ("e-child" in classes and is_parent_inner)
+            self.is_grandchild = ("e-child" in classes and is_parent_child)
+            self.is_in_grandchild = (parent is not None and parent.is_in_grandchild) or self.is_grandchild
+            self.is_in_state_heading = (parent is not None and parent.is_in_state_heading)
+            self.is_raw_text = (tag in StateExtractor.RAW_TEXT_ELEMENTS) or (parent is not None and parent.is_raw_text)
+
+            self.text = None
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+
+        self.stack = [self.Element("#document", frozenset())]
+
+        self.state_heading = None
+        self.widget = None
+        self.rows = None
+        self.cell = None
+
+        self.states = collections.deque()
+        self.widgets = collections.deque()
+        # Completed (state, rows, notes) records.
+        self.records = collections.deque()
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        parent = self.stack[-1]
+        classes = frozenset(next((value or "" for name, value in attrs if name == "class"), "").split())
+
+        element = self.Element(tag, classes, parent)
+        if "elementor-widget-heading" in classes and "elementor-widget-menu-anchor" in parent.last_child_classes:
+            element.is_in_state_heading = True
+        parent.last_child_classes = classes
+
+        if tag in self.VOID_ELEMENTS:
+            return
+
+        self.stack.append(element)
+
+        if "elementor-heading-title" in classes and element.is_in_state_heading and self.state_heading is None:
+            element.text = []
+            self.state_heading = element
+        elif "elementor-widget-text-editor" in classes and parent.is_in_grandchild and self.widget is None:
+            element.text = []
+            self.widget = element
+            self.rows = []
+        elif self.widget is not None:
+            if tag == "tr":
+                self.rows.append([])
+                self.cell = None
+            elif tag == "td" and self.rows:
+                element.text = []
+                self.rows[-1].append(element.text)
+                self.cell = element
+
+    def handle_endtag(self, tag: str) -> None:
+        stack = self.stack
+        for i in range(len(stack) - 1, 0, -1):
+            if stack[i].tag == tag:
+                break
+        else:
+            return
+
+        while len(stack) > i:
+            self.close_element(stack.pop())
+
+    def handle_data(self, data: str) -> None:
+        if self.stack[-1].is_raw_text:
+            return
+
+        if self.state_heading is not None:
+            self.state_heading.text.append(data)
+        if self.widget is not None:
+            self.widget.text.append(data)
+            if self.cell is not None:
+                self.cell.text.append(data)
+
+    def close(self) -> None:
+        super().close()
+        while len(self.stack) > 1:
+            self.close_element(self.stack.pop())
+
+    def close_element(self, element) -> None:
+        if element is self.state_heading:
+            self.states.append("".join(element.text))
+            self.state_heading = None
+        elif element is self.widget:
+            rows = [["".join(cell) for cell in row] for row in self.rows]
+            self.widgets.append((rows, "".join(element.text)))
+            self.widget = None
+            self.rows = None
+            self.cell = None
+        elif element is self.cell:
+            self.cell = None
+        else:
+            return
+
+        # Each state has a heading, followed by a table widget and a notes widget.
+        states = self.states
+        widgets = self.widgets
+        while states and len(widgets) >= 2:
+            rows, _ = widgets.popleft()
+            _, notes = widgets.popleft()
+            self.records.append((states.popleft(), rows, notes))
+
+    def pop_records(self):
+        records = self.records
+        while records:
+            yield records.popleft()
+
+
+class StateRecord(collections.abc.Mapping):
+    # Attribute of each title, in the order of the columns.
+    FIELDS = {
+        "State": "state",
+        "Type": "type",
+        "Bidding process": "bidding_process",
+        "Frequency": "frequency",
+        "Interest rate / penalty": "interest_rate_penalty",
+        "Redemption period": "redemption_period",
+        "Online auction": "online_auction",
+        "Over the counter": "over_the_counter",
+        "Statute": "statute",
+        "Notes": "notes",
+        "Description": "description"
+    }
+    __slots__ = (*FIELDS.values(), "extras", "titles")
+
+    # The titles of each record, in the order they were parsed. Only a few orders occur, so each is stored once.
+    title_orders = {}
+
+    def __init__(
+        self,
+
+        state: str = "",
+        type: str = "",
+        bidding_process: str = "",
+        frequency: str = "",
+        interest_rate_penalty: str = "",
+        redemption_period: str = "",
+        online_auction: str = "",
+        over_the_counter: str = "",
+        statute: str = "",
+        notes: str = "",
+        description: str = "",
+
+        extras: dict = None,
+        titles: tuple = None
+    ) -> None:
+        self.state = state
+        self.type = type
+        self.bidding_process = bidding_process
+        self.frequency = frequency
+        self.interest_rate_penalty = interest_rate_penalty
+        self.redemption_period = redemption_period
+        self.online_auction = online_auction
+        self.over_the_counter = over_the_counter
+        self.statute = statute
+        self.notes = notes
+        self.description = description
+        # Values of the titles without a field; None if there are none.
+        self.extras = (extras or None)
+
+        if titles is None:
+            titles = (*self.FIELDS, *(extras or ()))
+        self.titles = self.title_orders.setdefault(titles, titles)
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "StateRecord":
+        # Missing fields are empty and come after the fields of the item, in the order of FIELDS.
+        fields = cls.FIELDS
+        values = {}
+        extras = {}
+        for title, value in item.items():
+            attribute = fields.get(title)
+            if attribute is not None:
+                values[attribute] = value
+            else:
+                extras[title] = value
+
+        titles = (*item, *(title for title in fields if title not in item))
+        return cls(**values, extras=extras, titles=titles)
+
+    def to_dict(self) -> dict:
+        return {title: self[title] for title in self.titles}
+
+    def to_row(self) -> tuple:
+        # The field values in column order, without the extras.
+        return (
+            self.state,
+            self.type,
+            self.bidding_process,
+            self.frequency,
+            self.interest_rate_penalty,
+            self.redemption_period,
+            self.online_auction,
+            self.over_the_counter,
+            self.statute,
+            self.notes,
+            self.description
+        )
+
+    def __getitem__(self, title: str):
+        attribute = self.FIELDS.get(title)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if self.extras is None:
+            raise KeyError(title)
+        return self.extras[title]
+
+    def __contains__(self, title) -> bool:
+        return title in self.FIELDS or (self.extras is not None and title in self.extras)
+
+    def __iter__(self):
+        return iter(self.titles)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __repr__(self) -> str:
+        return f"StateRecord({self.to_dict()!r})"
+
+
+class RowView(collections.abc.Mapping):
+    # A read-only row of a ColumnarData, usable wherever a row dict is. It has the titles of its record, in their order.
+    __slots__ = ("data", "index")
+
+    def __init__(self, data, index: int) -> None:
+        self.data = data
+        self.index = index
+
+    def __getitem__(self, title: str):
+        data = self.data
+        if title not in data.title_sets[data.row_orders[self.index]]:
+            raise KeyError(title)
+        return data.columns[data.indexes[title]][self.index]
+
+    def __iter__(self):
+        data = self.data
+        return iter(data.title_orders[data.row_orders[self.index]])
+
+    def __len__(self) -> int:
+        data = self.data
+        return len(data.title_orders[data.row_orders[self.index]])
+
+    def __repr__(self) -> str:
+        return f"RowView({dict(self)!r})"
+
+
+class ColumnarData(collections.abc.Sequence):
+    # One list per title instead of one dict per row. Indexing returns row views.
+    def __init__(self, titles) -> None:
+        super().__init__()
+
+        self.titles = list(titles)
+        self.indexes = {title: i for i, title in enumerate(self.titles)}
+        self.columns = [[] for _ in self.titles]
+        self.length = 0
+
+        # The titles of each record, in the order they were parsed, as in StateRecord. Only a few orders occur, so each
+        # is stored once and the rows refer to it by index.
+        self.title_orders = []
+        self.title_sets = []
+        self.order_indexes = {}
+        self.row_orders = []
+
+    def add_column(self, title: str) -> list:
+        # Titles missing from the schema are added as they appear, empty in the previous rows.
+        column = [""] * self.length
+        self.indexes[title] = len(self.titles)
+        self.titles.append(title)
+        self.columns.append(column)
+        return column
+
+    def append(self, record: dict) -> None:
+        indexes = self.indexes
+        for title in record:
+            if title not in indexes:
+                self.add_column(title)
+
+        for title, column in zip(self.titles, self.columns):
+            column.append(record[title] if title in record else "")
+        self.length += 1
+
+        titles = tuple(record)
+        order = self.order_indexes.get(titles)
+        if order is None:
+            order = len(self.title_orders)
+            self.title_orders.append(titles)
+            self.title_sets.append(frozenset(titles))
+            self.order_indexes[titles] = order
+        self.row_orders.append(order)
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [RowView(self, i) for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("row index out of range")
+        return RowView(self, index)
+
+    def column(self, title: str) -> list:
+        return self.columns[self.indexes[title]]
+
+    def iter_tuples(self):
+        # The values of every column, in the order of the columns.
+        return zip(*self.columns)
+
+    def to_records(self) -> list:
+        return [dict(row) for row in self]
 
 
 class TaxSaleStates(metaclass=abc.ABCMeta):
+    STATE_HEADING_SELECTOR = soupsieve.compile(".elementor-widget-menu-anchor + .elementor-widget-heading .elementor-heading-title")
+    TABLE_NOTES_SELECTOR = soupsieve.compile(".e-con-inner > .e-child > .e-child .elementor-widget-text-editor")
+    ROW_SELECTOR = soupsieve.compile("tr")
+    CELL_SELECTOR = soupsieve.compile("td")
+
+    # Opening tags of the top-level containers and of the menu anchors that precede each state heading.
+    CONTAINER_PATTERN = re.compile(r"<div\s[^>]*?class=\"[^\"]*\be-parent\b")
+    ANCHOR_PATTERN = re.compile(r"<div\s[^>]*?class=\"[^\"]*\belementor-widget-menu-anchor\b")
+    # Large attributes and images that never contain state data.
+    NOISE_PATTERN = re.compile(r"\sdata-settings=\"[^\"]*\"|<img\b(?:[^>\"']|\"[^\"]*\"|'[^']*')*>")
+
     def __init__(self, name: str, uri: str, key_title: dict) -> None:
         super().__init__()
 
@@ -241,6 +1476,7 @@ class TaxSaleStates(metaclass=abc.ABCMeta):
         self.data_path = data_path
 
         self.html_file_path = f"{data_path}/{name}.html"
+        self.cache_file_path = f"{data_path}/{name}.cache.json"
 
         build_path = f"../build/{name}"
         self.build_path = build_path
@@ -249,6 +1485,16 @@ class TaxSaleStates(metaclass=abc.ABCMeta):
         self.csv_file_path = f"{build_path}/{name}.csv"
         self.json_file_path = f"{build_path}/{name}.json"
         self.markdown_file_path = f"{build_path}/{name}.md"
+        self.changes_file_path = f"{build_path}/{name}.changes.json"
+        self.stamp_file_path = f"{build_path}/.build.json"
+        self.stats_file_path = f"{build_path}/.stats.json"
+
+        self.build_file_paths = [
+            self.excel_file_path,
+            self.csv_file_path,
+            self.json_file_path,
+            self.markdown_file_path
+        ]
 
         self.key_title = key_title
 
@@ -257,31 +1503,39 @@ class TaxSaleStates(metaclass=abc.ABCMeta):
 
         self.title_title = {title: title for title in titles}
 
+        self.parser = default_parser()
+        self.is_sliced = True
+        # Holds the data in a ColumnarData instead of a list of records.
+        self.is_columnar = False
         self.markup = None
+        # HTTP validators (ETag, Last-Modified) and content hash of the markup.
+        self.validators = None
+        # Hash of the HTML source that the data is parsed from, whether fetched, saved or replayed.
+        self.source_sha256 = None
+        self.is_modified = True
 
         self.data = None
 
-    def add_missing_keys(self, row: dict) -> dict:
-        titles = self.titles
-        for title in titles:
-            if title not in row:
-                row[title] = ""
-        return row
+        self.stats = BuildStats(name)
 
     def parse_table(self, table) -> dict:
-        key_title = self.key_title
+        rows = (
+            [cell.get_text() for cell in self.CELL_SELECTOR.select(row)]
+            for row in self.ROW_SELECTOR.select(table)
+        )
+        return self.parse_rows(rows)
 
-        rows = table.select("tr")
+    def parse_rows(self, rows) -> dict:
+        key_title = self.key_title
 
         result = {}
 
-        for row in rows:
-            cells = row.select("td")
+        for cells in rows:
             if len(cells) < 2:
                 continue
 
-            key = cells[0].get_text().strip().rstrip(":")
-            value = cells[1].get_text().strip()
+            key = cells[0].strip().rstrip(":")
+            value = cells[1].strip()
             if len(key) <= 0 and len(value) <= 0:
                 continue
 
@@ -290,27 +1544,42 @@ class TaxSaleStates(metaclass=abc.ABCMeta):
 
         return result
 
+    def slice_markup(self, markup: str) -> str:
+        # Keep only the top-level containers from the first to the last menu anchor.
+        anchors = [match.start() for match in self.ANCHOR_PATTERN.finditer(markup)]
+        if not anchors:
+            return markup
+
+        containers = [match.start() for match in self.CONTAINER_PATTERN.finditer(markup)]
+        first = bisect.bisect_right(containers, anchors[0]) - 1
+        last = bisect.bisect_right(containers, anchors[-1])
+        if first < 0:
+            return markup
+
+        start = containers[first]
+        end = (containers[last] if last < len(containers) else len(markup))
+        return self.NOISE_PATTERN.sub("", markup[start:end])
+
+    def create_data(self):
+        return (ColumnarData(self.titles) if self.is_columnar else [])
+
     def parse(self) -> list:
-        items = []
+        items = self.create_data()
+
+        markup = self.markup
+        if self.is_sliced:
+            markup = self.slice_markup(markup)
 
-        soup = BeautifulSoup(self.markup, "html.parser")
+        soup = BeautifulSoup(markup, self.parser)
         # State headings.
-        state_headings = soup.select(".elementor-widget-menu-anchor + .elementor-widget-heading .elementor-heading-title")
+        state_headings = self.STATE_HEADING_SELECTOR.select(soup)
         # states = [state_heading.get_text().strip() for state_heading in state_headings]
 
         # Table and notes.
-        table_notes = iter(soup.select(".e-con-inner > .e-child > .e-child .elementor-widget-text-editor"))
+        table_notes = iter(self.TABLE_NOTES_SELECTOR.select(soup))
         i = 0
         for table, notes in itertools.zip_longest(table_notes, table_notes):
-            state = state_headings[i].get_text().strip()
-            table_items = self.parse_table(table)
-            description = notes.get_text().strip().removeprefix("NOTES:").lstrip()
-
-            item = self.add_missing_keys({
-                "State": state,
-                **table_items,
-                "Description": description
-            })
+            item = self.create_item(state_headings[i].get_text(), self.parse_table(table), notes.get_text())
             items.append(item)
             i += 1
 
@@ -318,6 +1587,39 @@ class TaxSaleStates(metaclass=abc.ABCMeta):
 
         return items
 
+    def create_item(self, state: str, table_items: dict, notes: str) -> StateRecord:
+        description = notes.strip().removeprefix("NOTES:").lstrip()
+        return StateRecord.from_dict({
+            "State": state.strip(),
+            **table_items,
+            "Description": description
+        })
+
+    def parse_stream(self, chunks):
+        # Yields each state as soon as its heading, table and notes have been fed.
+        extractor = StateExtractor()
+
+        def create_items():
+            for state, rows, notes in extractor.pop_records():
+                yield self.create_item(state, self.parse_rows(rows), notes)
+
+        for chunk in chunks:
+            extractor.feed(chunk)
+            yield from create_items()
+
+        extractor.close()
+        yield from create_items()
+
+    def parse_streaming(self, chunk_size: int = 65536) -> list:
+        markup = self.markup
+        chunks = (markup[i:i + chunk_size] for i in range(0, len(markup), chunk_size))
+
+        items = self.create_data()
+        items.extend(self.parse_stream(chunks))
+        self.data = items
+
+        return items
+
 
 KEY_TITLE = {
     "State": "State",
@@ -348,87 +1650,784 @@ class TaxDeedStates(TaxSaleStates):
         super().__init__(name, uri, KEY_TITLE)
 
 
+class SnapshotStore():
+    # Content-addressed copies of the fetched webpages, with an index of every fetch (one JSON object per line).
+    CODECS = ["gzip", "zstd"]
+    EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+    ZSTD_LEVEL = 12
+
+    def __init__(self, path: str, codec: str = None) -> None:
+        super().__init__()
+
+        if codec is None:
+            codec = ("zstd" if zstandard is not None else "gzip")
+        if codec not in self.CODECS:
+            raise ValueError(f"Unknown snapshot codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("The zstd codec requires the zstandard package")
+
+        self.path = path
+        self.index_file_path = f"{path}/index.ndjson"
+        self.codec = codec
+        # Concurrent builds share the index.
+        self.lock = threading.Lock()
+
+    def get_object_path(self, sha256: str, codec: str) -> str:
+        return f"{self.path}/objects/{sha256[:2]}/{sha256}.html{self.EXTENSIONS[codec]}"
+
+    def find_object(self, sha256: str) -> tuple:
+        # (path, codec) of the stored copy, whichever codec it was stored with.
+        for codec in self.CODECS:
+            path = self.get_object_path(sha256, codec)
+            if os.path.isfile(path):
+                return path, codec
+        return None, None
+
+    def compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.ZSTD_LEVEL).compress(data)
+        # No timestamp in the header, so that the same page gives the same file.
+        return gzip.compress(data, mtime=0)
+
+    @staticmethod
+    def decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise ValueError("The zstd codec requires the zstandard package")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def add(self, data: bytes, name: str, uri: str, status: int, etag: str = None, last_modified: str = None) -> dict:
+        # The page is only stored if no earlier fetch returned the same bytes; every fetch is indexed.
+        sha256 = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            object_path, codec = self.find_object(sha256)
+            if object_path is None:
+                codec = self.codec
+                object_path = self.get_object_path(sha256, codec)
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+                part_file_path = f"{object_path}.part"
+                with open(part_file_path, "wb") as file:
+                    file.write(self.compress(data))
+                os.replace(part_file_path, object_path)
+
+            entry = {
+                "time": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(timespec="seconds"),
+                "name": name,
+                "uri": uri,
+                "status": status,
+                "etag": etag,
+                "last_modified": last_modified,
+                "sha256": sha256,
+                "size": len(data),
+                "codec": codec
+            }
+            with open(self.index_file_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+        return entry
+
+    def load_index(self) -> list:
+        try:
+            with open(self.index_file_path, encoding="utf-8") as file:
+                return [json.loads(line) for line in file if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def find(self, name: str, at: datetime.datetime = None) -> dict:
+        # The last fetch of a list at or before the time; naive times are UTC.
+        if at is not None and at.tzinfo is None:
+            at = at.replace(tzinfo=datetime.timezone.utc)
+
+        found = None
+        for entry in self.load_index():
+            if entry["name"] != name:
+                continue
+            if at is not None and datetime.datetime.fromisoformat(entry["time"]) > at:
+                continue
+            found = entry
+        return found
+
+    def read(self, sha256: str) -> bytes:
+        object_path, codec = self.find_object(sha256)
+        if object_path is None:
+            raise FileNotFoundError(f"No snapshot {sha256} in {self.path}")
+
+        with open(object_path, "rb") as file:
+            data = self.decompress(file.read(), codec)
+
+        if hashlib.sha256(data).hexdigest() != sha256:
+            raise ValueError(f"Snapshot {sha256} is corrupted")
+        return data
+
+
+class RecordDiff():
+    # Compares two builds record by record, matching the records on a key field and hashing every record once.
+    def __init__(self, key: str = "State") -> None:
+        super().__init__()
+
+        self.key = key
+
+    @staticmethod
+    def hash_value(value) -> str:
+        return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def hash_record(cls, record) -> str:
+        # Independent of the order of the fields.
+        return cls.hash_value(dict(record))
+
+    def iter_keys(self, records):
+        # Records sharing a key value are matched in order.
+        counts = collections.Counter()
+        for record in records:
+            value = record.get(self.key)
+            yield (value, counts[value]), record
+            counts[value] += 1
+
+    def index(self, records) -> dict:
+        return {key: (record, self.hash_record(record)) for key, record in self.iter_keys(records)}
+
+    def compare(self, old_records, new_records) -> dict:
+        old = self.index(old_records)
+
+        added = []
+        changed = []
+        unchanged = 0
+        for key, record in self.iter_keys(new_records):
+            record_hash = self.hash_record(record)
+
+            previous = old.pop(key, None)
+            if previous is None:
+                added.append({self.key: key[0], "sha256": record_hash, "record": dict(record)})
+                continue
+
+            old_record, old_record_hash = previous
+            if old_record_hash == record_hash:
+                unchanged += 1
+                continue
+
+            # Only the records that differ are compared field by field.
+            fields = {}
+            for title in [*record, *(title for title in old_record if title not in record)]:
+                if title not in record or title not in old_record or self.hash_value(record[title]) != self.hash_value(old_record[title]):
+                    fields[title] = {"old": old_record.get(title), "new": record.get(title)}
+            changed.append({self.key: key[0], "sha256": record_hash, "old_sha256": old_record_hash, "fields": fields})
+
+        removed = [
+            {self.key: key[0], "sha256": old_record_hash, "record": dict(old_record)}
+            for key, (old_record, old_record_hash) in old.items()
+        ]
+
+        return {
+            "key": self.key,
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unchanged": unchanged
+        }
+
+
+class BuildErrors(Exception):
+    def __init__(self, errors: list) -> None:
+        super().__init__(f"{len(errors)} errors: " + "; ".join(repr(error) for error in errors))
+
+        self.errors = errors
+
+
 class MainController():
-    def __init__(self) -> None:
+    SNAPSHOTS_PATH = "../data/snapshots"
+
+    def __init__(
+        self,
+        concurrent: bool = False,
+        max_workers: int = None,
+        force: bool = False,
+        offline: bool = False,
+        retry_policy: RetryPolicy = None,
+        parser: str = None,
+        streaming: bool = False,
+        summary: bool = False,
+        write_only: bool = False,
+        max_column_width: int = None,
+        column_width_sample_size: int = None,
+        workbook_backend: str = "openpyxl",
+        shared_strings: bool = False,
+        compression_policy: CompressionPolicy = None,
+        parallel_writers: bool = False,
+        markdown_format: str = "grid",
+        json_format: str = "indent",
+        columnar: bool = False,
+        snapshot_store: SnapshotStore = None,
+        replay_time: datetime.datetime = None,
+        diff: bool = False
+    ) -> None:
         super().__init__()
 
+        self.concurrent = concurrent
+        self.max_workers = max_workers
+        self.force = force
+        self.offline = offline
+        self.retry_policy = (retry_policy if retry_policy is not None else RetryPolicy())
+        self.parser = parser
+        self.streaming = streaming
+        self.summary = summary
+        self.write_only = write_only
+        self.max_column_width = max_column_width
+        self.column_width_sample_size = column_width_sample_size
+        self.workbook_backend = workbook_backend
+        self.shared_strings = shared_strings
+        self.compression_policy = (compression_policy if compression_policy is not None else CompressionPolicy())
+        self.parallel_writers = parallel_writers
+        self.markdown_format = markdown_format
+        self.json_format = json_format
+        self.columnar = columnar
+        # Stores every fetched page if set; replay_time builds from the pages stored at that time instead.
+        self.snapshot_store = snapshot_store
+        self.replay_time = replay_time
+        self.diff = diff
+
         self.workbook_buffer = None
 
+    @staticmethod
+    def create_models() -> list:
+        return [TaxLienCertificateStates(), TaxDeedStates()]
+
     def run(self) -> None:
-        models = [TaxLienCertificateStates(), TaxDeedStates()]
+        models = self.create_models()
         for model in models:
-            self.build(model)
-            print()
+            if self.parser is not None:
+                model.parser = self.parser
+            model.is_columnar = self.columnar
+
+        try:
+            if self.concurrent:
+                self.run_concurrently(models)
+            else:
+                for model in models:
+                    self.build(model)
+                    print()
+        finally:
+            if self.summary:
+                self.print_summary(models)
+
+    def run_concurrently(self, models: list) -> None:
+        # Each model logs to its own buffer so that the output stays grouped per model.
+        def build(model) -> tuple:
+            output = StringIO()
+            try:
+                self.build(model, output)
+            except Exception as exception:
+                print(f" Failed: {exception!r}", file=output)
+                return output.getvalue(), exception
+            return output.getvalue(), None
+
+        max_workers = self.max_workers or len(models)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="build") as executor:
+            results = list(executor.map(build, models))
+
+        # Print in model order once every model is done.
+        errors = []
+        for output, exception in results:
+            print(output)
+            if exception is not None:
+                errors.append(exception)
+
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise BuildErrors(errors)
 
-    def build(self, model) -> None:
-        print(f"Building \"{model.name}\"...")
+    @staticmethod
+    def print_summary(models: list) -> None:
+        print(f"{'Model':<32} {'Stage':<40} {'Wall (ms)':>10} {'CPU (ms)':>10} {'In (KiB)':>10} {'Out (KiB)':>10} {'RSS (KiB)':>10}")
 
-        print("    Fetching data...", end="", flush=True)
-        model.markup = self.fetch_markup(model)
-        print(" Done.")
+        def kib(value):
+            return (f"{value / 1024:.0f}" if value is not None else "")
 
-        os.makedirs(model.data_path, exist_ok=True)
+        for model in models:
+            for stage in model.stats.stages:
+                if stage["wall_time"] is None:
+                    continue
+                print(
+                    f"{model.name:<32} {stage['stage']:<40}"
+                    f" {stage['wall_time'] * 1000:>10.1f} {stage['cpu_time'] * 1000:>10.1f}"
+                    f" {kib(stage['bytes_in']):>10} {kib(stage['bytes_out']):>10} {kib(stage['peak_rss_delta']):>10}"
+                )
+        print()
+
+    @contextmanager
+    def stage(self, model, stage: str, label: str = None, file=None):
+        if label is not None:
+            print(f"    {label}...", end="", flush=True, file=file)
+
+        with model.stats.measure(stage) as record:
+            yield record
+
+        if label is not None:
+            print(" Done.", file=file)
+
+    def build(self, model, file=None) -> None:
+        print(f"Building \"{model.name}\"...", file=file)
+
+        model.stats = BuildStats(model.name)
+        try:
+            self.build_model(model, file)
+        finally:
+            os.makedirs(model.build_path, exist_ok=True)
+            write_json_file(model.stats_file_path, model.stats.to_dict())
+
+    def build_model(self, model, file=None) -> None:
+        if self.replay_time is not None:
+            with self.stage(model, "replay", "Reading snapshot", file) as record:
+                model.markup = self.read_snapshot(model)
+                record["bytes_in"] = len(model.markup.encode("utf-8"))
+        elif self.offline:
+            with self.stage(model, "read", "Reading data", file) as record:
+                model.markup = self.read_markup(model)
+                record["bytes_in"] = file_size(model.html_file_path)
+        elif self.streaming:
+            os.makedirs(model.data_path, exist_ok=True)
+
+            with self.stage(model, "stream", "Fetching, writing and parsing data", file) as record:
+                self.stream_markup(model, file)
+                record["bytes_in"] = file_size(model.html_file_path)
+
+            self.store_snapshot(model, file)
+
+            if not model.is_modified and not self.force and self.is_up_to_date(model):
+                print("    Not modified. Skipped.", file=file)
+                return
+        else:
+            with self.stage(model, "fetch", "Fetching data", file) as record:
+                model.markup = self.fetch_markup(model, file)
+                record["bytes_in"] = len(model.markup.encode("utf-8"))
+
+            if not model.is_modified and not self.force and self.is_up_to_date(model):
+                self.store_snapshot(model, file)
+                print("    Not modified. Skipped.", file=file)
+                return
+
+            os.makedirs(model.data_path, exist_ok=True)
+
+            with self.stage(model, "write_markup", "Writing data", file) as record:
+                self.write_markup(model)
+                record["bytes_out"] = file_size(model.html_file_path)
+
+            self.store_snapshot(model, file)
+
+        if model.data is None:
+            with self.stage(model, "parse") as record:
+                if self.streaming:
+                    model.parse_streaming()
+                else:
+                    model.parse()
+                record["bytes_in"] = len(model.markup.encode("utf-8"))
+
+        with self.stage(model, "hash"):
+            stamp = self.create_stamp(model)
+        if not self.force and self.is_built(model) and self.is_same_build(stamp, self.load_stamp(model)):
+            # The outputs are now those of this source.
+            write_json_file(model.stamp_file_path, stamp)
+            print("    Data not changed. Skipped.", file=file)
+            return
 
-        print("    Writing data...", end="", flush=True)
-        self.write_markup(model)
-        print(" Done.")
+        os.makedirs(model.build_path, exist_ok=True)
 
-        model.parse()
+        if self.diff:
+            # Compared before the JSON file is overwritten, written once every output is.
+            with self.stage(model, "diff", "Comparing with the previous build", file):
+                changes = self.create_changes(model)
+
+        output_builders = [self.build_workbook, self.build_csv, self.build_json, self.build_markdown]
+        if self.parallel_writers:
+            # The writers are sub-stages of a single "write" stage, so that the totals count the elapsed time once.
+            try:
+                with self.stage(model, "write") as record:
+                    self.build_outputs_concurrently(model, output_builders, file)
+            finally:
+                model.stats.add_sub_stage_cpu_time(record)
+        else:
+            for output_builder in output_builders:
+                output_builder(model, file)
+
+        if self.diff:
+            with self.stage(model, "write_changes", "Writing changes", file) as record:
+                changes["sha256"] = hash_file(model.json_file_path)
+                write_json_file(model.changes_file_path, changes)
+                record["bytes_out"] = file_size(model.changes_file_path)
+
+        write_json_file(model.stamp_file_path, stamp)
+
+    def build_outputs_concurrently(self, model, output_builders: list, file=None) -> None:
+        # Every writer only reads the parsed data. Each logs to its own buffer, printed in order after the join.
+        def build_output(output_builder) -> tuple:
+            output = StringIO()
+            try:
+                output_builder(model, output, "write.")
+            except Exception as exception:
+                print(f" Failed: {exception!r}", file=output)
+                return output.getvalue(), exception
+            return output.getvalue(), None
+
+        with ThreadPoolExecutor(max_workers=len(output_builders), thread_name_prefix="write") as executor:
+            results = list(executor.map(build_output, output_builders))
+
+        errors = []
+        for output, exception in results:
+            print(output, end="", file=file)
+            if exception is not None:
+                errors.append(exception)
+
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise BuildErrors(errors)
+
+    def build_workbook(self, model, file=None, prefix: str = "") -> None:
+        with self.stage(model, f"{prefix}create_workbook", "Creating workbook", file) as record:
+            workbook_buffer = self.create_workbook(model, prefix)
+            record["bytes_out"] = workbook_buffer.getbuffer().nbytes
+
+        with self.stage(model, f"{prefix}write_workbook", "Writing workbook", file) as record:
+            self.write_workbook(model, workbook_buffer)
+            record["bytes_out"] = file_size(model.excel_file_path)
+
+    def build_csv(self, model, file=None, prefix: str = "") -> None:
+        with self.stage(model, f"{prefix}write_csv", "Writing CSV", file) as record:
+            self.write_csv(model)
+            record["bytes_out"] = file_size(model.csv_file_path)
+
+    def build_json(self, model, file=None, prefix: str = "") -> None:
+        with self.stage(model, f"{prefix}write_json", "Writing JSON", file) as record:
+            self.write_json(model)
+            record["bytes_out"] = file_size(model.json_file_path)
+
+    def build_markdown(self, model, file=None, prefix: str = "") -> None:
+        with self.stage(model, f"{prefix}write_markdown", "Writing markdown", file) as record:
+            self.write_markdown(model)
+            record["bytes_out"] = file_size(model.markdown_file_path)
 
-        print("    Creating workbook...", end="", flush=True)
-        workbook_buffer = self.create_workbook(model)
-        print(" Done.")
+    @staticmethod
+    def is_built(model) -> bool:
+        return all(os.path.isfile(path) for path in model.build_file_paths)
+
+    def is_up_to_date(self, model) -> bool:
+        # An unmodified webpage only needs no rebuild if the outputs were built from it, by this version with the same options.
+        # A replay of an older snapshot leaves the outputs of another source behind.
+        if not self.is_built(model):
+            return False
+        stamp = self.load_stamp(model)
+        return (
+            stamp is not None
+            and stamp.get("version") == BUILD_VERSION
+            and stamp.get("options") == self.build_options()
+            and stamp.get("source_sha256") == model.source_sha256
+        )
 
-        os.makedirs(model.build_path, exist_ok=True)
+    @staticmethod
+    def is_same_build(stamp: dict, previous_stamp: dict) -> bool:
+        # The source may differ; the outputs only depend on the data.
+        return previous_stamp is not None and all(previous_stamp.get(key) == stamp[key] for key in ("version", "options", "sha256"))
+
+    def build_options(self) -> dict:
+        # Options that change the output files for the same data.
+        return {
+            "write_only": self.write_only,
+            "max_column_width": self.max_column_width,
+            "column_width_sample_size": self.column_width_sample_size,
+            "workbook_backend": self.workbook_backend,
+            "shared_strings": self.shared_strings,
+            "compression": {
+                "mode": self.compression_policy.mode,
+                "level": self.compression_policy.level
+            },
+            "markdown_format": self.markdown_format,
+            "json_format": self.json_format
+        }
 
-        print("    Writing workbook...", end="", flush=True)
-        self.write_workbook(model, workbook_buffer)
-        print(" Done.")
+    def create_stamp(self, model) -> dict:
+        return {
+            "version": BUILD_VERSION,
+            "options": self.build_options(),
+            "sha256": hash_json([list(model.titles), model.data]),
+            "source_sha256": model.source_sha256
+        }
 
-        print("    Writing CSV...", end="", flush=True)
-        self.write_csv(model)
-        print(" Done.")
+    @staticmethod
+    def create_changes(model) -> dict:
+        # Without a previous build, every record is added. A previous build that cannot be read is an error.
+        try:
+            previous_sha256 = hash_file(model.json_file_path)
+            previous_data = fetch_json_records(model.json_file_path)
+        except FileNotFoundError:
+            previous_sha256 = None
+            previous_data = []
+
+        changes = RecordDiff().compare(previous_data, model.data)
+        return {
+            "time": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(timespec="seconds"),
+            # Hashes of the JSON files that the changes lead from and to.
+            "previous_sha256": previous_sha256,
+            "sha256": None,
+            **changes
+        }
 
-        print("    Writing JSON...", end="", flush=True)
-        self.write_json(model)
-        print(" Done.")
+    @staticmethod
+    def load_stamp(model) -> dict:
+        try:
+            return fetch_json_file(model.stamp_file_path)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def load_validators(model) -> dict:
+        # The validators are only usable if the saved markup is the one they were recorded for.
+        try:
+            validators = fetch_json_file(model.cache_file_path)
+            sha256 = hash_file(model.html_file_path)
+        except (OSError, ValueError):
+            return None
+
+        if validators.get("uri") != model.uri or validators.get("sha256") != sha256:
+            return None
+
+        model.validators = validators
+        return validators
 
-        print("    Writing markdown...", end="", flush=True)
-        self.write_markdown(model)
-        print(" Done.")
+    @staticmethod
+    def conditional_headers(validators: dict) -> dict:
+        headers = {}
+        if validators is not None:
+            if validators.get("etag"):
+                headers["if-none-match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["if-modified-since"] = validators["last_modified"]
+        return headers
 
-    def fetch_markup(self, model) -> str:
-        response = session.get(url=model.uri, timeout=5)
+    @staticmethod
+    def create_validators(model, response, sha256: str = None) -> dict:
+        response_headers = response.headers
+        return {
+            "uri": model.uri,
+            "etag": response_headers.get("etag"),
+            "last_modified": response_headers.get("last-modified"),
+            "sha256": sha256
+        }
+
+    def fetch_markup(self, model, file=None) -> str:
+        validators = self.load_validators(model)
+        response = self.get(model, self.conditional_headers(validators), file)
 
         status_code = response.status_code
-        if not (status_code == requests.codes.ok or status_code == requests.codes.partial_content):
-            print(f"    Received status code {status_code} while fetching {model.name} data. Retrying...")
-            time.sleep(5)
-            return self.fetch_markup(model)
+        if status_code == requests.codes.not_modified and validators is not None:
+            model.is_modified = False
+            model.source_sha256 = validators["sha256"]
+            return fetch_text_file(model.html_file_path)
+
+        markup = response.text
+        model.is_modified = True
+        model.validators = self.create_validators(model, response)
+        return markup
+
+    def stream_markup(self, model, file=None, chunk_size: int = 65536) -> None:
+        # A body that fails midway is fetched again from the start. The requests and the reads share the attempts and the deadline.
+        retry_policy = self.retry_policy
+        attempts = RetryAttempts(retry_policy)
+
+        validators = self.load_validators(model)
+        part_file_path = f"{model.html_file_path}.part"
+
+        try:
+            while True:
+                response = self.get(model, self.conditional_headers(validators), file, stream=True, attempts=attempts)
+
+                with closing(response):
+                    if response.status_code == requests.codes.not_modified and validators is not None:
+                        model.is_modified = False
+                        model.source_sha256 = validators["sha256"]
+                        model.markup = fetch_text_file(model.html_file_path)
+                        return
+
+                    try:
+                        sha256 = self.write_stream(model, response, part_file_path, chunk_size)
+                        break
+                    except retry_policy.RETRY_EXCEPTIONS as exception:
+                        error = exception
+
+                delay = retry_policy.delay(attempts.count)
+                if not attempts.allows_retry(delay):
+                    raise error
+
+                print(f"    Received {type(error).__name__} while reading {model.name} data. Retrying in {delay:.1f} s...", file=file)
+                time.sleep(delay)
 
-        return response.text
+            os.replace(part_file_path, model.html_file_path)
+        finally:
+            if os.path.exists(part_file_path):
+                os.remove(part_file_path)
+
+        model.markup = None
+        model.is_modified = True
+        model.source_sha256 = sha256
+        model.validators = self.create_validators(model, response, sha256)
+        write_json_file(model.cache_file_path, model.validators)
+
+    @staticmethod
+    def write_stream(model, response, part_file_path: str, chunk_size: int) -> str:
+        # Tees the response body into the part file and the streaming parser in one pass.
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        sha256 = hashlib.sha256()
+
+        # No newline translation, so that the hash matches the file.
+        with open(part_file_path, "w", encoding="utf-8", newline="") as html_file:
+            def chunks():
+                for data in response.iter_content(chunk_size=chunk_size):
+                    yield decoder.decode(data)
+                yield decoder.decode(b"", final=True)
+
+            def tee(chunks):
+                for chunk in chunks:
+                    if chunk:
+                        html_file.write(chunk)
+                        sha256.update(chunk.encode("utf-8"))
+                        yield chunk
+
+            items = model.create_data()
+            items.extend(model.parse_stream(tee(chunks())))
+            model.data = items
+
+        return sha256.hexdigest()
+
+    def get(self, model, headers: dict = None, file=None, stream: bool = False, attempts: RetryAttempts = None):
+        retry_policy = self.retry_policy
+        if attempts is None:
+            attempts = RetryAttempts(retry_policy)
+
+        while True:
+            attempts.count += 1
+            remaining = attempts.remaining()
+
+            response = None
+            try:
+                response = session.get(
+                    url=model.uri,
+                    headers=headers,
+                    timeout=min(retry_policy.timeout, max(remaining, 0.1)),
+                    stream=stream
+                )
+            except retry_policy.RETRY_EXCEPTIONS as exception:
+                reason = type(exception).__name__
+                error = exception
+            else:
+                status_code = response.status_code
+                if status_code in (requests.codes.ok, requests.codes.partial_content, requests.codes.not_modified):
+                    return response
+
+                response.close()
+                reason = f"status code {status_code}"
+                error = requests.HTTPError(f"Received {reason} while fetching {model.name} data.", response=response)
+                if not retry_policy.is_retryable(status_code):
+                    raise error
+
+            delay = retry_policy.delay(attempts.count, response)
+            if not attempts.allows_retry(delay):
+                raise error
+
+            print(f"    Received {reason} while fetching {model.name} data. Retrying in {delay:.1f} s...", file=file)
+            time.sleep(delay)
+
+    def store_snapshot(self, model, file=None) -> None:
+        # Stores the saved HTML source file, which is also what a replay reads back.
+        snapshot_store = self.snapshot_store
+        if snapshot_store is None:
+            return
+
+        with self.stage(model, "snapshot", "Storing snapshot", file) as record:
+            with open(model.html_file_path, "rb") as html_file:
+                data = html_file.read()
+            validators = (model.validators or {})
+            snapshot_store.add(
+                data,
+                name=model.name,
+                uri=model.uri,
+                status=(requests.codes.ok if model.is_modified else requests.codes.not_modified),
+                etag=validators.get("etag"),
+                last_modified=validators.get("last_modified")
+            )
+            record["bytes_in"] = len(data)
+
+    def read_snapshot(self, model) -> str:
+        entry = self.snapshot_store.find(model.name, self.replay_time)
+        if entry is None:
+            raise FileNotFoundError(f"No snapshot of \"{model.name}\" at or before {self.replay_time.isoformat()}")
+        model.source_sha256 = entry["sha256"]
+        return self.snapshot_store.read(entry["sha256"]).decode("utf-8")
+
+    @staticmethod
+    def read_markup(model) -> str:
+        model.source_sha256 = hash_file(model.html_file_path)
+        return fetch_text_file(model.html_file_path)
 
     @staticmethod
     def write_markup(model) -> None:
         write_text_file(model.html_file_path, model.markup)
+        model.source_sha256 = hash_file(model.html_file_path)
+        if model.validators is not None:
+            model.validators["sha256"] = model.source_sha256
+            write_json_file(model.cache_file_path, model.validators)
+
+    def create_workbook(self, model, prefix: str = ""):
+        if self.workbook_backend == "template":
+            return self.create_template_workbook(model, prefix)
 
-    def create_workbook(self, model):
         name = model.name
+        stats = model.stats
         workbook_controller = WorkbookController()
-        with closing(workbook_controller.create_workbook(
-            key_title=model.title_title,
-            data=model.data,
-
-            workbook_title=name,
-            sheet_title=name,
-            table_name=type(model).__name__
-        )) as workbook:
-            workbook_buffer = BytesIO()
-            workbook.save(workbook_buffer)
-            workbook_buffer = workbook_controller.fix_workbook_mime_type(workbook_buffer)
+        with stats.measure(f"{prefix}create_workbook.sheet"):
+            workbook = workbook_controller.create_workbook(
+                key_title=model.title_title,
+                data=model.data,
+
+                workbook_title=name,
+                sheet_title=name,
+                table_name=type(model).__name__,
+
+                write_only=self.write_only,
+                max_column_width=self.max_column_width,
+                column_width_sample_size=self.column_width_sample_size
+            )
+        with closing(workbook):
+            with stats.measure(f"{prefix}create_workbook.save") as record:
+                workbook_buffer = workbook_controller.save_workbook(workbook, self.compression_policy)
+                record["bytes_out"] = workbook_buffer.getbuffer().nbytes
             self.workbook_buffer = workbook_buffer
             return workbook_buffer
 
+    def create_template_workbook(self, model, prefix: str = ""):
+        name = model.name
+        shared_strings = (SharedStrings() if self.shared_strings else None)
+        with model.stats.measure(f"{prefix}create_workbook.template") as record:
+            workbook_buffer = TemplateWorkbookWriter.create_workbook(
+                key_title=model.title_title,
+                data=model.data,
+
+                workbook_title=name,
+                sheet_title=name,
+                table_name=type(model).__name__,
+
+                max_column_width=self.max_column_width,
+                column_width_sample_size=self.column_width_sample_size,
+                shared_strings=shared_strings,
+                compression_policy=self.compression_policy
+            )
+            record["bytes_out"] = workbook_buffer.getbuffer().nbytes
+            if shared_strings is not None:
+                record["shared_strings"] = shared_strings.to_dict()
+        self.workbook_buffer = workbook_buffer
+        return workbook_buffer
+
     def write_workbook(self, model, workbook_buffer=None) -> None:
         with open(model.excel_file_path, "wb") as file:
             if workbook_buffer is None:
@@ -439,24 +2438,337 @@ class MainController():
     @staticmethod
     def write_csv(model) -> None:
         with open(model.csv_file_path, "w") as file:
+            data = model.data
+            if isinstance(data, ColumnarData):
+                # The rows are read straight from the columns, in title order.
+                writer = csv.writer(file)
+                writer.writerow(data.titles)
+                writer.writerows(data.iter_tuples())
+                return
+
+            if list(model.titles) == list(StateRecord.FIELDS) and all(isinstance(record, StateRecord) and record.extras is None for record in data):
+                writer = csv.writer(file)
+                writer.writerow(model.titles)
+                writer.writerows(record.to_row() for record in data)
+                return
+
             writer = csv.DictWriter(file, fieldnames=model.titles)
             writer.writeheader()
             writer.writerows(model.data)
 
+    def write_json(self, model) -> None:
+        write_json_records(model.json_file_path, model.data, self.json_format)
+
+    def write_markdown(self, model) -> None:
+        markdown = MarkdownTable(model.data, self.markdown_format).get_markdown()
+        write_text_file(model.markdown_file_path, markdown)
+
+
+class SnapshotController():
+    # Parses archived copies of the webpages, e.g. to back-fill the data after a schema change.
+    def __init__(self, max_workers: int = None, parser: str = None, streaming: bool = False, output_path: str = None) -> None:
+        super().__init__()
+
+        self.max_workers = max_workers
+        self.parser = parser
+        self.streaming = streaming
+        self.output_path = output_path
+
     @staticmethod
-    def write_json(model) -> None:
-        write_json_file(model.json_file_path, model.data)
+    def find_model(path: str):
+        # The file name starts with the name of the list, e.g. "Tax deed states 2024-01-01.html".
+        name = os.path.basename(path)
+        models = [model for model in MainController.create_models() if name.startswith(model.name)]
+        if not models:
+            raise ValueError(f"No list matches the file name: {name}")
+        return max(models, key=lambda model: len(model.name))
 
     @staticmethod
-    def write_markdown(model) -> None:
-        markdown = markdown_table(model.data).get_markdown()
-        write_text_file(model.markdown_file_path, markdown)
+    def parse_snapshot(path: str, parser: str = None, streaming: bool = False) -> list:
+        # Runs in a worker process, so it only takes and returns picklable values.
+        model = SnapshotController.find_model(path)
+        if parser is not None:
+            model.parser = parser
+        model.markup = fetch_text_file(path)
+
+        data = (model.parse_streaming() if streaming else model.parse())
+        return [record.to_dict() for record in data]
+
+    def parse_snapshots(self, paths: list) -> list:
+        # (path, data, exception) for each path, in order. A file that fails does not stop the others.
+        results = []
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.parse_snapshot, path, self.parser, self.streaming) for path in paths]
+            for path, future in zip(paths, futures):
+                try:
+                    results.append((path, future.result(), None))
+                except Exception as exception:
+                    results.append((path, None, exception))
+        return results
+
+    def run(self, path: str) -> None:
+        names = sorted(name for name in os.listdir(path) if name.endswith(".html"))
+        paths = [os.path.join(path, name) for name in names]
+
+        output_path = (self.output_path if self.output_path is not None else os.path.join(path, "parsed"))
+        os.makedirs(output_path, exist_ok=True)
+
+        print(f"Parsing {len(paths)} snapshots...")
+        errors = []
+        for snapshot_path, data, exception in self.parse_snapshots(paths):
+            name = os.path.basename(snapshot_path)
+            if exception is not None:
+                print(f"    {name}... Failed: {exception!r}")
+                errors.append(exception)
+                continue
+
+            write_json_file(os.path.join(output_path, f"{os.path.splitext(name)[0]}.json"), data)
+            print(f"    {name}... {len(data)} states.")
+
+        if errors:
+            raise BuildErrors(errors)
+
+
+def measure(function, repeat: int = 1) -> list:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def measure_peak_memory(function) -> int:
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+class BenchmarkController():
+    BENCHMARKS = ["parse", "workbook", "compression", "markdown"]
+    WORKBOOK_SCALES = [1, 100]
+
+    def __init__(self, repeat: int = 5) -> None:
+        super().__init__()
+
+        self.repeat = repeat
+
+    def run(self, names: list) -> None:
+        models = MainController.create_models()
+        for model in models:
+            model.markup = MainController.read_markup(model)
+
+        for name in names:
+            getattr(self, f"benchmark_{name}")(models)
+            print()
+
+    @staticmethod
+    def print_times(label: str, times: list, peak: int = None) -> None:
+        line = f"        {label}: min {min(times) * 1000:.1f} ms, mean {sum(times) / len(times) * 1000:.1f} ms"
+        if peak is not None:
+            line += f", peak {peak / 1024 / 1024:.1f} MiB"
+        print(line)
+
+    def benchmark_parse(self, models: list) -> None:
+        print("Parse time per page:")
+        for model in models:
+            print(f"    {model.name} ({len(model.markup) / 1024:.0f} KiB):")
+            default = (model.parser, model.is_sliced)
+            for parser in available_parsers():
+                model.parser = parser
+                for model.is_sliced in (False, True):
+                    label = (f"{parser} (sliced)" if model.is_sliced else parser)
+                    self.print_times(label, measure(model.parse, self.repeat), measure_peak_memory(model.parse))
+            model.parser, model.is_sliced = default
+
+            self.print_times("streaming", measure(model.parse_streaming, self.repeat), measure_peak_memory(model.parse_streaming))
+
+    def benchmark_workbook(self, models: list) -> None:
+        print("Workbook creation time:")
+        for model in models:
+            model.parse()
+            data = model.data
+            table_name = type(model).__name__
+            for scale in self.WORKBOOK_SCALES:
+                scaled_data = data * scale
+                print(f"    {model.name} ({len(scaled_data)} rows):")
+
+                def create_openpyxl(write_only: bool):
+                    workbook = WorkbookController.create_workbook(
+                        key_title=model.title_title,
+                        data=scaled_data,
+                        workbook_title=model.name,
+                        sheet_title=model.name,
+                        table_name=table_name,
+                        write_only=write_only
+                    )
+                    with closing(workbook):
+                        return WorkbookController.save_workbook(workbook)
+
+                def create_template(shared_strings: bool):
+                    return TemplateWorkbookWriter.create_workbook(
+                        key_title=model.title_title,
+                        data=scaled_data,
+                        workbook_title=model.name,
+                        sheet_title=model.name,
+                        table_name=table_name,
+                        shared_strings=(SharedStrings() if shared_strings else None)
+                    )
+
+                functions = [
+                    ("openpyxl", lambda: create_openpyxl(False)),
+                    ("openpyxl (write-only)", lambda: create_openpyxl(True)),
+                    ("template", lambda: create_template(False)),
+                    ("template (shared strings)", lambda: create_template(True))
+                ]
+                for label, function in functions:
+                    self.print_times(label, measure(function, self.repeat), measure_peak_memory(function))
+
+    def benchmark_compression(self, models: list) -> None:
+        print("Workbook save time and size:")
+        policies = [
+            ("stored", CompressionPolicy("stored")),
+            ("deflate 1", CompressionPolicy("deflate", 1)),
+            ("deflate", CompressionPolicy("deflate")),
+            ("deflate 9", CompressionPolicy("deflate", 9)),
+            ("mixed", CompressionPolicy("mixed"))
+        ]
+        for model in models:
+            model.parse()
+            for scale in self.WORKBOOK_SCALES:
+                scaled_data = model.data * scale
+                print(f"    {model.name} ({len(scaled_data)} rows):")
+                workbook = WorkbookController.create_workbook(
+                    key_title=model.title_title,
+                    data=scaled_data,
+                    workbook_title=model.name,
+                    sheet_title=model.name,
+                    table_name=type(model).__name__
+                )
+                with closing(workbook):
+                    for label, policy in policies:
+                        def save():
+                            return WorkbookController.save_workbook(workbook, policy)
+
+                        size = save().getbuffer().nbytes
+                        self.print_times(f"{label} ({size / 1024:.0f} KiB)", measure(save, self.repeat))
+
+    def benchmark_markdown(self, models: list) -> None:
+        print("Markdown render time and size:")
+        for model in models:
+            model.parse()
+            for scale in self.WORKBOOK_SCALES:
+                scaled_data = model.data * scale
+                print(f"    {model.name} ({len(scaled_data)} rows):")
+
+                functions = []
+                if markdown_table is not None:
+                    # py_markdown_table only accepts dicts.
+                    records = [dict(record) for record in scaled_data]
+                    functions.append(("py_markdown_table", lambda: markdown_table(records).get_markdown()))
+                for format in MarkdownTable.FORMATS:
+                    functions.append((format, lambda format=format: MarkdownTable(scaled_data, format).get_markdown()))
+
+                for label, function in functions:
+                    size = len(function().encode("utf-8"))
+                    self.print_times(f"{label} ({size / 1024:.0f} KiB)", measure(function, self.repeat), measure_peak_memory(function))
+
+
+def parse_arguments(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Builds the tax sale state lists from TedThomas.com.")
+    parser.add_argument("--concurrent", action="store_true", help="build every list concurrently")
+    parser.add_argument("--max-workers", type=int, default=None, help="maximum number of concurrent builds, or of processes parsing snapshots")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the webpage was not modified")
+    parser.add_argument("--offline", action="store_true", help="build from the saved HTML source files without fetching")
+    parser.add_argument("--max-attempts", type=int, default=5, help="maximum number of attempts to fetch a webpage")
+    parser.add_argument("--timeout", type=float, default=10.0, help="timeout of each attempt, in seconds")
+    parser.add_argument("--deadline", type=float, default=300.0, help="total time allowed to fetch a webpage, in seconds")
+    parser.add_argument("--parser", choices=PARSERS, default=None, help="HTML parser (default: lxml if installed, else html.parser)")
+    parser.add_argument("--streaming", action="store_true", help="extract the states with the incremental parser instead of building a full DOM")
+    parser.add_argument("--write-only", action="store_true", help="write the worksheet rows as they are produced")
+    parser.add_argument("--max-column-width", type=int, default=None, help=f"maximum width of the worksheet columns (Excel displays at most {ColumnWidths.MAX_WIDTH})")
+    parser.add_argument("--column-width-sample-size", type=int, default=None, help="number of rows measured to size the worksheet columns (default: all)")
+    parser.add_argument("--workbook-backend", choices=["openpyxl", "template"], default="openpyxl", help="write the workbook with openpyxl or by filling in a prebuilt template")
+    parser.add_argument("--shared-strings", action="store_true", help="store the values of repetitive columns once in a shared strings table (template backend only)")
+    parser.add_argument("--compression", choices=CompressionPolicy.MODES, default="deflate", help="compression of the workbook members (mixed stores the small ones and deflates the others)")
+    parser.add_argument("--compression-level", type=int, choices=range(1, 10), default=None, metavar="{1-9}", help="deflate level of the workbook members (default: zlib's default)")
+    parser.add_argument("--parallel-writers", action="store_true", help="write the workbook, CSV, JSON and markdown files of each list concurrently")
+    parser.add_argument("--markdown-format", choices=MarkdownTable.FORMATS, default="grid", help="format of the markdown table (grid: padded code block, gfm: compact pipe table, aligned: padded pipe table)")
+    parser.add_argument("--json-format", choices=JSON_FORMATS, default="indent", help="format of the JSON file (indent: indented array, compact: array without whitespace, ndjson: one record per line)")
+    parser.add_argument("--columnar", action="store_true", help="hold the parsed data in one list per column instead of one dict per state")
+    parser.add_argument("--store-snapshots", action="store_true", help=f"keep a compressed copy of every distinct webpage fetched, with an index of the fetches (in {MainController.SNAPSHOTS_PATH})")
+    parser.add_argument("--snapshot-codec", choices=SnapshotStore.CODECS, default=None, help="compression of the stored webpages (default: zstd if installed, else gzip)")
+    parser.add_argument("--replay", metavar="TIME", type=datetime.datetime.fromisoformat, default=None, help="build from the webpages stored at or before an ISO 8601 time (UTC if no offset) instead of fetching")
+    parser.add_argument("--diff", action="store_true", help="write the states added, removed and changed since the previous build, keyed on State")
+    parser.add_argument("--summary", action="store_true", help="print the time spent in each stage at the end")
+    parser.add_argument("--parse-snapshots", metavar="DIRECTORY", default=None, help="parse every HTML snapshot in a directory across processes instead of building")
+    parser.add_argument("--snapshots-output", metavar="DIRECTORY", default=None, help="directory of the JSON files parsed from the snapshots (default: DIRECTORY/parsed)")
+    parser.add_argument("--benchmark", nargs="+", choices=BenchmarkController.BENCHMARKS, default=None, help="benchmark the saved HTML source files instead of building")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repetitions of each benchmark")
+
+    arguments = parser.parse_args(argv)
+    # openpyxl always writes inline strings.
+    if arguments.shared_strings and arguments.workbook_backend != "template":
+        parser.error("--shared-strings requires --workbook-backend template")
+    return arguments
 
 
 def main(argv: list[str]) -> None:
-    main_controller = MainController()
+    arguments = parse_arguments(argv)
+    if arguments.benchmark:
+        benchmark_controller = BenchmarkController(repeat=arguments.repeat)
+        benchmark_controller.run(arguments.benchmark)
+        return
+
+    if arguments.parse_snapshots:
+        snapshot_controller = SnapshotController(
+            max_workers=arguments.max_workers,
+            parser=arguments.parser,
+            streaming=arguments.streaming,
+            output_path=arguments.snapshots_output
+        )
+        snapshot_controller.run(arguments.parse_snapshots)
+        return
+
+    main_controller = MainController(
+        concurrent=arguments.concurrent,
+        max_workers=arguments.max_workers,
+        force=arguments.force,
+        offline=arguments.offline,
+        retry_policy=RetryPolicy(
+            max_attempts=arguments.max_attempts,
+            timeout=arguments.timeout,
+            deadline=arguments.deadline
+        ),
+        parser=arguments.parser,
+        streaming=arguments.streaming,
+        summary=arguments.summary,
+        write_only=arguments.write_only,
+        max_column_width=arguments.max_column_width,
+        column_width_sample_size=arguments.column_width_sample_size,
+        workbook_backend=arguments.workbook_backend,
+        shared_strings=arguments.shared_strings,
+        compression_policy=CompressionPolicy(
+            mode=arguments.compression,
+            level=arguments.compression_level
+        ),
+        parallel_writers=arguments.parallel_writers,
+        markdown_format=arguments.markdown_format,
+        json_format=arguments.json_format,
+        columnar=arguments.columnar,
+        snapshot_store=(
+            SnapshotStore(MainController.SNAPSHOTS_PATH, arguments.snapshot_codec)
+            if arguments.store_snapshots or arguments.replay is not None else None
+        ),
+        replay_time=arguments.replay,
+        diff=arguments.diff
+    )
     main_controller.run()
 
 
 if __name__ == "__main__":
-    main([])
\ No newline at end of file
+    main(sys.argv[1:])
\ No newline at end of file